@@ -6,20 +6,29 @@ This bot receives restricted message links and sends the content back to users
 
 import os
 import re
+import json
+import time
 import asyncio
 import logging
-from typing import Optional, Dict, Any
-from urllib.parse import urlparse, parse_qs
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple, Union
 
-from telethon import TelegramClient, events
+try:
+    # RE2 gives linear-time matching with no backtracking
+    import re2 as link_re
+except ImportError:
+    link_re = re
+
+from telethon import TelegramClient, events, utils
 from telethon.tl.types import (
     Message, MessageMediaPhoto, MessageMediaDocument, 
-    MessageMediaWebPage
+    MessageMediaWebPage, DocumentAttributeFilename,
+    Channel, InputPeerChannel, PeerChannel
 )
 from telethon.errors import (
     SessionPasswordNeededError, PhoneCodeInvalidError,
     FloodWaitError, ChatAdminRequiredError, ChannelPrivateError,
-    MessageNotModifiedError
+    ChannelInvalidError, MessageNotModifiedError
 )
 
 # Configure logging
@@ -29,7 +38,114 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Maximum number of formatted messages kept in memory
+MESSAGE_CACHE_SIZE = 1024
+# Maximum number of resolved entities kept in memory
+ENTITY_CACHE_SIZE = 1024
+
+# Known channel access hashes, so private channels can be used without a lookup
+ACCESS_HASH_FILE = 'access_hashes.json'
+
+# Shared client settings: Telethon sleeps through flood waits up to
+# flood_sleep_threshold seconds instead of raising FloodWaitError
+CLIENT_OPTIONS = {
+    'flood_sleep_threshold': 60,
+    'connection_retries': 5,
+    'request_retries': 5,
+    'auto_reconnect': True,
+}
+
+# Telegram allows bots roughly 30 outgoing messages per second
+SEND_RATE_PER_SECOND = 30
+# How many times a send is retried after a FloodWaitError
+FLOOD_WAIT_RETRIES = 3
+# Longer flood waits are reported instead of slept through
+MAX_FLOOD_WAIT = CLIENT_OPTIONS['flood_sleep_threshold']
+
+# Maximum number of links from one message processed at the same time
+MAX_CONCURRENT_LINKS = 5
+
+# Messages longer than this are scanned for links in a worker thread
+LARGE_TEXT_THRESHOLD = 64 * 1024
+
+# Document media type by the major part of its MIME type
+_MEDIA_KIND = {'video': 'video', 'audio': 'audio'}
+
+# Web page preview fields appended to the text, with their prefixes
+_WEBPAGE_FIELDS = (('title', "\n\n🔗 "), ('description', "\n"), ('url', "\n"))
+
+# Precompiled regex patterns
+# Single pattern for t.me links including thread support:
+#   t.me/c/chat_id/message_id or t.me/c/chat_id/thread_id/message_id
+#   t.me/channel/message_id or t.me/channel/thread_id/message_id
+#   telegram.me/channel/message_id or telegram.me/channel/thread_id/message_id
+_PARSE_RE = link_re.compile(
+    r't\.me/c/(?P<cid>-?\d+)/(?P<a>\d+)(?:/(?P<b>\d+))?'
+    r'|(?:t\.me|telegram\.me)/(?P<chan>[^/]+)/(?P<pa>\d+)(?:/(?P<pb>\d+))?'
+)
+
+# Extracts Telegram links from a message. RE2's \s only covers ASCII whitespace,
+# so its pattern also stops at the Unicode separators Python's \s matches
+if link_re is re:
+    _LINK_EXTRACT_RE = re.compile(r'https?://(?:t\.me|telegram\.me)/\S+')
+else:
+    _LINK_EXTRACT_RE = link_re.compile(r'https?://(?:t\.me|telegram\.me)/[^\s\pZ\x0b\x1c-\x1f\x85]+')
+
+
+def _may_contain_link(text: Optional[str]) -> bool:
+    """Cheap substring check that runs before any regex work"""
+    return bool(text) and ('t.me' in text or 'telegram.me' in text)
+
+def _lru_get(cache: OrderedDict, key):
+    """Return a cached value and mark it as recently used"""
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+def _lru_put(cache: OrderedDict, key, value, maxsize: int):
+    """Store a value, evicting the least recently used entry when full"""
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > maxsize:
+        cache.popitem(last=False)
+
+def _chunks(text: str, size: int):
+    """Yield consecutive slices of text, each at most size characters long"""
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+class TokenBucket:
+    """Token bucket rate limiter shared by all outgoing requests"""
+    
+    __slots__ = ('rate', 'capacity', 'tokens', 'last_refill', '_lock')
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self, n: int = 1):
+        """Wait until n tokens are available and take them"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                await asyncio.sleep((n - self.tokens) / self.rate)
+
 class RestrictedMessageBot:
+    __slots__ = (
+        'api_id', 'api_hash', 'bot_token', 'phone_number',
+        'bot_client', 'user_client',
+        'message_cache', '_inflight', '_entity_cache', '_access_hashes', '_bucket'
+    )
+    
     def __init__(self):
         # Get credentials from environment variables
         self.api_id = os.getenv('TELEGRAM_API_ID')
@@ -44,21 +160,54 @@ class RestrictedMessageBot:
         self.bot_client = None
         self.user_client = None
         
-        # Cache for processed messages
-        self.message_cache: Dict[str, Any] = {}
+        # LRU cache for processed messages
+        self.message_cache: "OrderedDict[Tuple[Any, int], Any]" = OrderedDict()
+        
+        # Fetches currently in progress, shared by concurrent requests for the same message
+        self._inflight: Dict[Tuple[Any, int], asyncio.Future] = {}
+        
+        # LRU cache of resolved entities per client, keyed by (client id, chat_id)
+        self._entity_cache: "OrderedDict[Tuple[int, Union[int, str]], Any]" = OrderedDict()
+        
+        # Persisted channel access hashes per client, keyed by channel id
+        self._access_hashes: Dict[str, Dict[str, int]] = self._load_access_hashes()
+        
+        # Paces every outgoing send/edit/delete to stay under Telegram's limits
+        self._bucket = TokenBucket(SEND_RATE_PER_SECOND, SEND_RATE_PER_SECOND)
+    
+    async def _rate_limited(self, func, *args, **kwargs):
+        """Call an outgoing Telegram method through the rate limiter"""
+        for attempt in range(FLOOD_WAIT_RETRIES + 1):
+            await self._bucket.acquire()
+            try:
+                return await func(*args, **kwargs)
+            except FloodWaitError as e:
+                if attempt == FLOOD_WAIT_RETRIES or e.seconds > MAX_FLOOD_WAIT:
+                    logger.error("Giving up after flood wait of %ss", e.seconds)
+                    raise
+                logger.warning("Flood wait of %ss, retrying", e.seconds)
+                await asyncio.sleep(e.seconds)
+    
+    def _cache_get(self, key: Tuple[Any, int]) -> Optional[Dict[str, Any]]:
+        """Return cached content and mark it as recently used"""
+        return _lru_get(self.message_cache, key)
+    
+    def _cache_put(self, key: Tuple[Any, int], content: Dict[str, Any]):
+        """Store content, evicting the least recently used entry when full"""
+        _lru_put(self.message_cache, key, content, MESSAGE_CACHE_SIZE)
         
     async def initialize_clients(self):
         """Initialize both bot and user clients"""
         try:
             # Initialize bot client
             if self.bot_token:
-                self.bot_client = TelegramClient('bot_session', self.api_id, self.api_hash)
+                self.bot_client = TelegramClient('bot_session', self.api_id, self.api_hash, **CLIENT_OPTIONS)
                 await self.bot_client.start(bot_token=self.bot_token)
                 logger.info("Bot client initialized successfully")
             
             # Initialize user client (needed for accessing restricted content)
             if self.phone_number:
-                self.user_client = TelegramClient('user_session', self.api_id, self.api_hash)
+                self.user_client = TelegramClient('user_session', self.api_id, self.api_hash, **CLIENT_OPTIONS)
                 await self.user_client.start(phone=self.phone_number)
                 logger.info("User client initialized successfully")
             
@@ -66,63 +215,126 @@ class RestrictedMessageBot:
                 logger.warning("User client not available - some restricted content may not be accessible")
                 
         except Exception as e:
-            logger.error(f"Failed to initialize clients: {e}")
+            logger.error("Failed to initialize clients: %s", e)
             raise
     
     def parse_telegram_link(self, url: str) -> Optional[Dict[str, Any]]:
         """Parse Telegram message link and extract channel/chat and message ID"""
         try:
-            # Pattern for t.me links including thread support
-            patterns = [
-                r't\.me/c/(-?\d+)/(\d+)(?:/(\d+))?',  # t.me/c/chat_id/message_id or t.me/c/chat_id/thread_id/message_id
-                r't\.me/([^/]+)/(\d+)(?:/(\d+))?',  # t.me/channel/message_id or t.me/channel/thread_id/message_id
-                r'telegram\.me/([^/]+)/(\d+)(?:/(\d+))?',  # telegram.me/channel/message_id or telegram.me/channel/thread_id/message_id
-            ]
+            match = _PARSE_RE.search(url)
+            if not match:
+                return None
             
-            for i, pattern in enumerate(patterns):
-                match = re.search(pattern, url)
-                if match:
-                    if i == 0:  # t.me/c/ pattern
-                        # Private chat link
-                        chat_id = int(match.group(1))
-                        if chat_id > 0:
-                            chat_id = int(f"-100{chat_id}")
-                        
-                        # Check if it's a threaded message (3 groups) or regular message (2 groups)
-                        if match.group(3):  # threaded message: chat_id/thread_id/message_id
-                            message_id = int(match.group(3))
-                            thread_id = int(match.group(2))
-                        else:  # regular message: chat_id/message_id
-                            message_id = int(match.group(2))
-                            thread_id = None
-                    else:
-                        # Public channel link
-                        chat_id = match.group(1)
-                        
-                        # Check if it's a threaded message
-                        if match.group(3):  # threaded message: channel/thread_id/message_id
-                            message_id = int(match.group(3))
-                            thread_id = int(match.group(2))
-                        else:  # regular message: channel/message_id
-                            message_id = int(match.group(2))
-                            thread_id = None
-                    
-                    result = {
-                        'chat_id': chat_id,
-                        'message_id': message_id,
-                        'original_url': url
-                    }
-                    
-                    if thread_id:
-                        result['thread_id'] = thread_id
-                    
-                    return result
+            if match.group('cid') is not None:
+                # Private chat link
+                chat_id = int(match.group('cid'))
+                if chat_id > 0:
+                    chat_id = int(f"-100{chat_id}")
+                first, second = match.group('a'), match.group('b')
+            else:
+                # Public channel link
+                chat_id = match.group('chan')
+                first, second = match.group('pa'), match.group('pb')
             
-            return None
+            # Check if it's a threaded message: chat/thread_id/message_id
+            if second:
+                message_id = int(second)
+                thread_id = int(first)
+            else:  # regular message: chat/message_id
+                message_id = int(first)
+                thread_id = None
+            
+            result = {
+                'chat_id': chat_id,
+                'message_id': message_id,
+                'original_url': url
+            }
+            
+            if thread_id:
+                result['thread_id'] = thread_id
+            
+            return result
             
         except Exception as e:
-            logger.error(f"Error parsing Telegram link: {e}")
+            logger.error("Error parsing Telegram link: %s", e)
+            return None
+    
+    def _load_access_hashes(self) -> Dict[str, Dict[str, int]]:
+        """Load persisted channel access hashes from disk"""
+        try:
+            with open(ACCESS_HASH_FILE) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load access hashes: %s", e)
+            return {}
+    
+    def _save_access_hashes(self):
+        """Write channel access hashes to disk"""
+        try:
+            tmp_file = f"{ACCESS_HASH_FILE}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(self._access_hashes, f)
+            os.replace(tmp_file, ACCESS_HASH_FILE)
+        except OSError as e:
+            logger.warning("Could not save access hashes: %s", e)
+    
+    def _client_name(self, client: TelegramClient) -> str:
+        return 'user' if client is self.user_client else 'bot'
+    
+    @staticmethod
+    def _channel_id(chat_id: Union[int, str]) -> Optional[int]:
+        """Return the bare channel id for a marked channel chat_id, else None"""
+        if not isinstance(chat_id, int):
             return None
+        real_id, peer_type = utils.resolve_id(chat_id)
+        return real_id if peer_type is PeerChannel else None
+    
+    async def _resolve(self, client: TelegramClient, chat_id: Union[int, str]):
+        """Resolve an entity through the given client, reusing earlier lookups"""
+        key = (id(client), chat_id)
+        entity = _lru_get(self._entity_cache, key)
+        if entity is not None:
+            return entity
+        
+        # Private channels with a known access hash need no network lookup
+        channel_id = self._channel_id(chat_id)
+        hashes = self._access_hashes.get(self._client_name(client), {})
+        if channel_id is not None and str(channel_id) in hashes:
+            entity = InputPeerChannel(channel_id, hashes[str(channel_id)])
+        else:
+            entity = await client.get_entity(chat_id)
+            if channel_id is not None and isinstance(entity, Channel) and entity.access_hash is not None:
+                self._access_hashes.setdefault(self._client_name(client), {})[str(channel_id)] = entity.access_hash
+                self._save_access_hashes()
+        
+        _lru_put(self._entity_cache, key, entity, ENTITY_CACHE_SIZE)
+        return entity
+    
+    def _forget_entity(self, client: TelegramClient, chat_id: Union[int, str]):
+        """Drop a cached entity, e.g. after access to it was lost"""
+        self._entity_cache.pop((id(client), chat_id), None)
+        
+        channel_id = self._channel_id(chat_id)
+        hashes = self._access_hashes.get(self._client_name(client), {})
+        if channel_id is not None and hashes.pop(str(channel_id), None) is not None:
+            self._save_access_hashes()
+    
+    async def _get_messages(self, client: TelegramClient, chat_id: Union[int, str], message_id: int):
+        """Fetch a message through the given client using a cached entity"""
+        entity = await self._resolve(client, chat_id)
+        try:
+            return await client.get_messages(entity, ids=message_id)
+        except (ChannelPrivateError, ChannelInvalidError) as e:
+            # Only a persisted access hash yields an InputPeerChannel; it may be
+            # stale, so resolve the channel again once before giving up
+            if not isinstance(entity, InputPeerChannel):
+                raise
+            logger.info("Stored access hash for %s failed (%s), resolving again", chat_id, e)
+            self._forget_entity(client, chat_id)
+            entity = await self._resolve(client, chat_id)
+            return await client.get_messages(entity, ids=message_id)
     
     async def get_message_content(self, chat_id, message_id: int) -> Optional[Message]:
         """Fetch message content from Telegram"""
@@ -130,31 +342,32 @@ class RestrictedMessageBot:
             # Try with user client first (can access restricted content)
             if self.user_client:
                 try:
-                    entity = await self.user_client.get_entity(chat_id)
-                    message = await self.user_client.get_messages(entity, ids=message_id)
+                    message = await self._get_messages(self.user_client, chat_id, message_id)
                     if message and not isinstance(message, list):
                         return message
                     elif isinstance(message, list) and message:
                         return message[0]
-                except (ChannelPrivateError, ChatAdminRequiredError) as e:
-                    logger.warning(f"User client couldn't access {chat_id}: {e}")
+                except (ChannelPrivateError, ChatAdminRequiredError, ChannelInvalidError) as e:
+                    self._forget_entity(self.user_client, chat_id)
+                    logger.warning("User client couldn't access %s: %s", chat_id, e)
             
             # Fallback to bot client
             if self.bot_client:
                 try:
-                    entity = await self.bot_client.get_entity(chat_id)
-                    message = await self.bot_client.get_messages(entity, ids=message_id)
+                    message = await self._get_messages(self.bot_client, chat_id, message_id)
                     if message and not isinstance(message, list):
                         return message
                     elif isinstance(message, list) and message:
                         return message[0]
                 except Exception as e:
-                    logger.warning(f"Bot client couldn't access {chat_id}: {e}")
+                    if isinstance(e, (ChannelPrivateError, ChatAdminRequiredError, ChannelInvalidError)):
+                        self._forget_entity(self.bot_client, chat_id)
+                    logger.warning("Bot client couldn't access %s: %s", chat_id, e)
             
             return None
             
         except Exception as e:
-            logger.error(f"Error fetching message content: {e}")
+            logger.error("Error fetching message content: %s", e)
             return None
     
     async def format_message_content(self, message: Message) -> Dict[str, Any]:
@@ -187,33 +400,29 @@ class RestrictedMessageBot:
                     
                     # Try to get filename
                     for attr in doc.attributes:
-                        if hasattr(attr, 'file_name'):
+                        if isinstance(attr, DocumentAttributeFilename):
                             result['file_name'] = attr.file_name
                             break
                     
                     # Check if it's a video, audio, etc.
-                    if doc.mime_type:
-                        if doc.mime_type.startswith('video/'):
-                            result['media_type'] = 'video'
-                        elif doc.mime_type.startswith('audio/'):
-                            result['media_type'] = 'audio'
+                    mime_type = doc.mime_type or ''
+                    kind = mime_type.partition('/')[0]
+                    result['media_type'] = _MEDIA_KIND.get(kind, 'document')
                 
 
                 
                 elif isinstance(message.media, MessageMediaWebPage):
                     # Handle web page previews
                     webpage = message.media.webpage
-                    if hasattr(webpage, 'title') and webpage.title:
-                        result['text'] += f"\n\n🔗 {webpage.title}"
-                    if hasattr(webpage, 'description') and webpage.description:
-                        result['text'] += f"\n{webpage.description}"
-                    if hasattr(webpage, 'url') and webpage.url:
-                        result['text'] += f"\n{webpage.url}"
+                    for field, prefix in _WEBPAGE_FIELDS:
+                        value = getattr(webpage, field, None)
+                        if value:
+                            result['text'] += f"{prefix}{value}"
             
             return result
             
         except Exception as e:
-            logger.error(f"Error formatting message content: {e}")
+            logger.error("Error formatting message content: %s", e)
             return {'text': 'Error processing message content', 'media': None}
     
     async def send_content_to_user(self, chat_id: int, content: Dict[str, Any], original_url: str, reply_to_msg_id: int = None, sender_id: int = None):
@@ -223,16 +432,9 @@ class RestrictedMessageBot:
                 logger.error("Bot client not available")
                 return
             
-            # Prepare header message with user tag if sender_id is provided
-            header = ""
-            
             # Send media if available
             if content.get('media') and content.get('media_type'):
-                media_caption = header
-                if content.get('caption'):
-                    media_caption += content['caption']
-                elif content.get('text'):
-                    media_caption += content['text']
+                media_caption = content.get('caption') or content.get('text') or ''
                 
                 # Limit caption length (Telegram limit is 1024 characters)
                 if len(media_caption) > 1000:
@@ -240,7 +442,8 @@ class RestrictedMessageBot:
                 
                 try:
                     if content['media_type'] == 'photo':
-                        await self.bot_client.send_file(
+                        await self._rate_limited(
+                            self.bot_client.send_file,
                             chat_id, 
                             content['media'],
                             caption=media_caption,
@@ -248,7 +451,8 @@ class RestrictedMessageBot:
                             reply_to=reply_to_msg_id
                         )
                     elif content['media_type'] in ['video', 'audio', 'document']:
-                        await self.bot_client.send_file(
+                        await self._rate_limited(
+                            self.bot_client.send_file,
                             chat_id,
                             content['media'],
                             caption=media_caption,
@@ -256,42 +460,42 @@ class RestrictedMessageBot:
                             reply_to=reply_to_msg_id
                         )
                 except Exception as e:
-                    logger.error(f"Error sending media: {e}")
+                    logger.error("Error sending media: %s", e)
                     # Fallback to text only
-                    await self.bot_client.send_message(
+                    await self._rate_limited(
+                        self.bot_client.send_message,
                         chat_id,
-                        f"{header}❌ Media could not be sent, but here's the text:\n\n{content.get('text', 'No text content')}",
+                        f"❌ Media could not be sent, but here's the text:\n\n{content.get('text', 'No text content')}",
                         parse_mode='markdown',
                         reply_to=reply_to_msg_id
                     )
             
             # Send text content if no media or as additional message
             elif content.get('text'):
-                full_text = header + content['text']
+                full_text = content['text']
                 
                 # Split long messages
                 if len(full_text) > 4000:
-                    await self.bot_client.send_message(chat_id, header, parse_mode='markdown', reply_to=reply_to_msg_id)
-                    
-                    # Split text into chunks
-                    text_chunks = [content['text'][i:i+4000] for i in range(0, len(content['text']), 4000)]
-                    for chunk in text_chunks:
-                        await self.bot_client.send_message(chat_id, chunk, reply_to=reply_to_msg_id)
+                    # Send chunks in order, one after another
+                    for chunk in _chunks(full_text, 4000):
+                        await self._rate_limited(self.bot_client.send_message, chat_id, chunk, reply_to=reply_to_msg_id)
                 else:
-                    await self.bot_client.send_message(chat_id, full_text, parse_mode='markdown', reply_to=reply_to_msg_id)
+                    await self._rate_limited(self.bot_client.send_message, chat_id, full_text, parse_mode='markdown', reply_to=reply_to_msg_id)
             
             else:
-                await self.bot_client.send_message(
+                await self._rate_limited(
+                    self.bot_client.send_message,
                     chat_id,
-                    f"{header}❌ No content found in the message.",
+                    "❌ No content found in the message.",
                     parse_mode='markdown',
                     reply_to=reply_to_msg_id
                 )
                 
         except Exception as e:
-            logger.error(f"Error sending content to user: {e}")
+            logger.error("Error sending content to user: %s", e)
             try:
-                await self.bot_client.send_message(
+                await self._rate_limited(
+                    self.bot_client.send_message,
                     chat_id,
                     f"❌ Error processing your request: {str(e)}",
                     reply_to=reply_to_msg_id
@@ -299,6 +503,94 @@ class RestrictedMessageBot:
             except:
                 pass
     
+    async def _get_content(self, chat_id, message_id: int) -> Optional[Dict[str, Any]]:
+        """Return formatted content for a message, coalescing concurrent fetches"""
+        # Check cache first
+        cache_key = (chat_id, message_id)
+        content = self._cache_get(cache_key)
+        if content is not None:
+            logger.info("Using cached content for %s", cache_key)
+            return content
+        
+        # Another request is already fetching this message, wait for its result
+        future = self._inflight.get(cache_key)
+        if future is not None:
+            logger.info("Waiting for in-flight fetch of %s", cache_key)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Re-raise if this task was cancelled; if the fetching task was, fetch it ourselves
+                if not future.cancelled():
+                    raise
+                return await self._get_content(chat_id, message_id)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        try:
+            # Fetch message content
+            message = await self.get_message_content(chat_id, message_id)
+            if message:
+                # Format and cache the content
+                content = await self.format_message_content(message)
+                self._cache_put(cache_key, content)
+            future.set_result(content)
+            return content
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else is waiting
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._inflight[cache_key]
+    
+    async def _process_one_link(self, link: str, event, chat_id: int, original_msg_id: int, sender_id: int, semaphore: asyncio.Semaphore):
+        """Fetch a single link and send its content back to the user"""
+        # Bound how many links from the same message are fetched at once
+        async with semaphore:
+            try:
+                processing_msg = await self._rate_limited(event.reply, "🔄 Processing your request...")
+            except Exception as reply_error:
+                logger.error("Could not send processing message for %s: %s", link, reply_error)
+                return
+            
+            try:
+                # Parse the link
+                parsed = self.parse_telegram_link(link)
+                if not parsed:
+                    await self._rate_limited(processing_msg.edit, f"❌ Invalid Telegram link format: {link}")
+                    return
+                
+                # Get content from cache or fetch it
+                content = await self._get_content(parsed['chat_id'], parsed['message_id'])
+                if content is None:
+                    await self._rate_limited(processing_msg.edit, "❌ Could not access the message. It might be from a private channel or the message doesn't exist.")
+                    return
+                
+                # Send content to user
+                await self.send_content_to_user(chat_id, content, link, original_msg_id, sender_id)
+                
+                # Delete the processing message after successful send
+                try:
+                    await self._rate_limited(processing_msg.delete)
+                except Exception as delete_error:
+                    logger.warning("Could not delete processing message: %s", delete_error)
+                    
+            except Exception as process_error:
+                logger.error("Error processing link %s: %s", link, process_error)
+                try:
+                    await self._rate_limited(processing_msg.edit, f"❌ Error processing link: {str(process_error)}")
+                except Exception as edit_error:
+                    logger.warning("Could not edit processing message: %s", edit_error)
+    
+    async def _extract_links(self, text: str):
+        """Find Telegram links, off the event loop for very large texts"""
+        if len(text) > LARGE_TEXT_THRESHOLD:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, _LINK_EXTRACT_RE.findall, text)
+        return _LINK_EXTRACT_RE.findall(text)
+    
     async def handle_message(self, event):
         """Handle incoming messages"""
         try:
@@ -307,63 +599,29 @@ class RestrictedMessageBot:
             original_msg_id = event.message.id
             sender_id = event.sender_id
             
+            # Skip the regex entirely when the text can't contain a link
+            if not _may_contain_link(message_text):
+                return
+            
             # Only process messages that contain Telegram links using regex
-            telegram_link_pattern = r'https?://(?:t\.me|telegram\.me)/[^\s]+'
-            telegram_links = re.findall(telegram_link_pattern, message_text)
+            telegram_links = await self._extract_links(message_text)
             
             # If no Telegram links found, ignore the message silently
             if not telegram_links:
                 return
             
-            # Process each link
-            for link in telegram_links:
-                processing_msg = await event.reply("🔄 Processing your request...")
-                
-                try:
-                    # Parse the link
-                    parsed = self.parse_telegram_link(link)
-                    if not parsed:
-                        await processing_msg.edit(f"❌ Invalid Telegram link format: {link}")
-                        continue
-                    
-                    # Check cache first
-                    cache_key = f"{parsed['chat_id']}_{parsed['message_id']}"
-                    if cache_key in self.message_cache:
-                        logger.info(f"Using cached content for {cache_key}")
-                        content = self.message_cache[cache_key]
-                    else:
-                        # Fetch message content
-                        message = await self.get_message_content(parsed['chat_id'], parsed['message_id'])
-                        if not message:
-                            await processing_msg.edit(f"❌ Could not access the message. It might be from a private channel or the message doesn't exist.")
-                            continue
-                        
-                        # Format content
-                        content = await self.format_message_content(message)
-                        
-                        # Cache the content
-                        self.message_cache[cache_key] = content
-                    
-                    # Send content to user
-                    await self.send_content_to_user(chat_id, content, link, original_msg_id, sender_id)
-                    
-                    # Delete the processing message after successful send
-                    try:
-                        await processing_msg.delete()
-                    except Exception as delete_error:
-                        logger.warning(f"Could not delete processing message: {delete_error}")
-                        
-                except Exception as process_error:
-                    logger.error(f"Error processing link {link}: {process_error}")
-                    try:
-                        await processing_msg.edit(f"❌ Error processing link: {str(process_error)}")
-                    except Exception as edit_error:
-                        logger.warning(f"Could not edit processing message: {edit_error}")
+            # Process the links concurrently, a few at a time so the user
+            # session isn't flooded; each one handles its own errors
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_LINKS)
+            await asyncio.gather(*(
+                self._process_one_link(link, event, chat_id, original_msg_id, sender_id, semaphore)
+                for link in telegram_links
+            ))
                 
         except Exception as e:
-            logger.error(f"Error handling message: {e}")
+            logger.error("Error handling message: %s", e)
             try:
-                await event.reply(f"❌ An error occurred: {str(e)}")
+                await self._rate_limited(event.reply, f"❌ An error occurred: {str(e)}")
             except:
                 pass
     
@@ -378,7 +636,7 @@ class RestrictedMessageBot:
             
             # Set up event handlers
             # Only handle messages that contain Telegram links
-            @self.bot_client.on(events.NewMessage(pattern=re.compile(r'.*(?:https?://(?:t\.me|telegram\.me)/[^\s]+).*', re.IGNORECASE)))
+            @self.bot_client.on(events.NewMessage(func=lambda e: _may_contain_link(e.raw_text)))
             async def message_handler(event):
                 await self.handle_message(event)
             
@@ -409,13 +667,13 @@ Just send me a link to get started! 🚀
 • https://t.me/c/chat_id/thread_id/message_id (threaded messages)
 • https://telegram.me/channel/message_id
 """
-                await event.reply(welcome_text, parse_mode='markdown')
+                await self._rate_limited(event.reply, welcome_text, parse_mode='markdown')
             
             logger.info("Bot is running...")
             await self.bot_client.run_until_disconnected()
             
         except Exception as e:
-            logger.error(f"Error running bot: {e}")
+            logger.error("Error running bot: %s", e)
         finally:
             if self.bot_client:
                 await self.bot_client.disconnect()
@@ -444,7 +702,7 @@ def main():
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
-        logger.error(f"Fatal error: {e}")
+        logger.error("Fatal error: %s", e)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,10 +1,7 @@
 #!/usr/bin/env python3
-import re
-
-# Test the regex pattern used in the bot
-pattern = r'.*(?:https?://(?:t\.me|telegram\.me)/[^\s]+).*'
-link_extract_pattern = r'https?://(?:t\.me|telegram\.me)/[^\s]+'
+from main import _PARSE_RE, _LINK_EXTRACT_RE, _may_contain_link
 
+# Test the regex patterns used in the bot
 test_messages = [
     'https://t.me/ikan_live/29914',
     'Check this out: https://t.me/channel/12345',
@@ -17,29 +14,38 @@ test_messages = [
     'https://t.me/c/1234567890/123',        # Regular private chat
 ]
 
-# Test parsing patterns
-parse_patterns = [
-    r't\.me/c/(-?\d+)/(\d+)(?:/(\d+))?',   # t.me/c/chat_id/message_id or t.me/c/chat_id/thread_id/message_id
-    r't\.me/([^/]+)/(\d+)(?:/(\d+))?',     # t.me/channel/message_id or t.me/channel/thread_id/message_id
-    r'telegram\.me/([^/]+)/(\d+)(?:/(\d+))?',  # telegram.me/channel/message_id or telegram.me/channel/thread_id/message_id
-]
+# Expected named groups for each link: private (cid/a/b) or public (chan/pa/pb)
+expected_parses = {
+    'https://t.me/ikan_live/29914': {'chan': 'ikan_live', 'pa': '29914', 'pb': None},
+    'https://t.me/channel/12345': {'chan': 'channel', 'pa': '12345', 'pb': None},
+    'https://telegram.me/test/456': {'chan': 'test', 'pa': '456', 'pb': None},
+    'https://t.me/a/1': {'chan': 'a', 'pa': '1', 'pb': None},
+    'https://t.me/b/2': {'chan': 'b', 'pa': '2', 'pb': None},
+    'https://t.me/c/2059632753/17/577843': {'cid': '2059632753', 'a': '17', 'b': '577843'},
+    'https://t.me/c/1234567890/123': {'cid': '1234567890', 'a': '123', 'b': None},
+}
 
-print('Testing message filtering pattern:')
+print('Testing link extraction and parsing:')
 for msg in test_messages:
-    match = re.match(pattern, msg, re.IGNORECASE)
-    links = re.findall(link_extract_pattern, msg)
+    links = _LINK_EXTRACT_RE.findall(msg) if _may_contain_link(msg) else []
     print(f'Message: "{msg}"')
-    print(f'  -> Filter match: {bool(match)}')
     print(f'  -> Links found: {links}')
-    
+
     # Test parsing for each found link
     for link in links:
-        print(f'  -> Parsing "{link}":')
-        for i, parse_pattern in enumerate(parse_patterns):
-            parse_match = re.search(parse_pattern, link)
-            if parse_match:
-                print(f'    Pattern {i+1} matched: {parse_match.groups()}')
-                break
-        else:
-            print('    No parsing pattern matched')
+        parse_match = _PARSE_RE.search(link)
+        if not parse_match:
+            print(f'  -> Parsing "{link}": no match')
+            continue
+        groups = {k: v for k, v in parse_match.groupdict().items() if v is not None}
+        print(f'  -> Parsing "{link}": {groups}')
+        for name, value in expected_parses[link].items():
+            assert parse_match.group(name) == value, (link, name, parse_match.group(name))
     print()
+
+# Links separated by Unicode whitespace (e.g. a non-breaking space) stay separate
+for separator in ('\xa0', '\u2003', '\u3000', '\v'):
+    msg = f'https://t.me/a/1{separator}https://t.me/b/2'
+    links = _LINK_EXTRACT_RE.findall(msg)
+    print(f'Separator {separator!r}: {links}')
+    assert links == ['https://t.me/a/1', 'https://t.me/b/2'], links